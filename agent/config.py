@@ -1,16 +1,39 @@
 # agent/config.py
 # """Central configuration values for the agent."""
 import os
+from fnmatch import fnmatch
+from typing import Callable
 from dotenv import load_dotenv
 load_dotenv()
 
 MODEL = "alibaba-qwen3-32b"          # or "llama3.1:8b", "mistral-small3.2", etc.
 #MODEL = "anthropic-claude-4.5-sonnet"          # or "llama3.1:8b", "mistral-small3.2", etc.
 TEMPERATURE = 0.2               # low for determinism in code tasks
-MAX_TURNS_BEFORE_COMPACTION = 40  # future hook
+MAX_TURNS_BEFORE_COMPACTION = 40  # history length (messages) that triggers compaction
+MAX_TOOL_RESULT_CHARS = 4096      # tool output kept in history (head + tail)
 
 ENABLE_AUTOMERGE = False        # ← human toggle – set True when ready
 CONFIRM_PR_CREATION = True      # still on for safety
+GITHUB_CACHE_TTL = float(os.getenv("GITHUB_CACHE_TTL", "45"))  # seconds PR/CI status is reused
+
+# Branch names / PR titles (fnmatch patterns) that skip the confirmation prompt
+PRE_APPROVED_PATTERNS: list[str] = []
+
+def cli_approval(prompt: str) -> bool:
+    """Default approval: ask on the terminal."""
+    return input(f"{prompt} [y/N]: ").strip().lower() in ("y", "yes")
+
+# Called as APPROVAL_CALLBACK(prompt) -> bool before branch/PR creation.
+# The driver or tests may replace it (e.g. to collect approvals elsewhere).
+APPROVAL_CALLBACK: Callable[[str], bool] = cli_approval
+
+def request_approval(prompt: str, *subjects: str) -> bool:
+    """True if confirmation is off, a subject matches PRE_APPROVED_PATTERNS, or the callback approves."""
+    if not CONFIRM_PR_CREATION:
+        return True
+    if any(fnmatch(s, p) for s in subjects for p in PRE_APPROVED_PATTERNS):
+        return True
+    return APPROVAL_CALLBACK(prompt)
 
 # Ollama server assumed running at localhost:11434
 #OLLAMA_API_BASE = "http://localhost:11434"
@@ -4,19 +4,34 @@ Main driver for the Ollama-powered autonomous coding agent.
 Runs the conversation loop, dispatches tools, manages memory, and enforces workflow rules.
 """
 
+import atexit
+import contextlib
+import functools
 import os
+import queue
 import json
 import sys
+import threading
 import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 from pathlib import Path
+
+import orjson
 #from openai import OpenAI
-from litellm import completion
+from litellm import completion, stream_chunk_builder
 
-from agent.config import MODEL, TEMPERATURE, ENABLE_AUTOMERGE, ENDPOINT_URL, BEARER_TOKEN
+from agent.config import (
+    MODEL, TEMPERATURE, ENABLE_AUTOMERGE, ENDPOINT_URL, BEARER_TOKEN,
+    MAX_TURNS_BEFORE_COMPACTION, MAX_TOOL_RESULT_CHARS,
+)
 from agent.prompts import SYSTEM_PROMPT
-from agent.tools import ALL_TOOLS, execute_tool
+from agent.tools import (
+    ALL_TOOLS_COMPACT, IDEMPOTENT_TOOLS, execute_tool, invalidate_tool_cache, looks_like_error,
+)
+from agent.tools.github import wait_for_pending_pushes
+from agent.tools.shell import refresh_cwd
 
 #TODO: Fix object formats
 warnings.filterwarnings("ignore", category=UserWarning, module="pydantic")
@@ -24,6 +39,7 @@ warnings.filterwarnings("ignore", category=UserWarning, module="pydantic")
 # ─── Constants & Paths ─────────────────────────────────────────────────────
 REPO_ROOT = Path.home() / "makobot"
 os.chdir(REPO_ROOT)
+refresh_cwd()
 
 MEMORY_DIR = REPO_ROOT / "memory"
 GOALS_FILE = MEMORY_DIR / "goals.json"
@@ -34,83 +50,296 @@ LLM_LOG = MEMORY_DIR / "llm-calls.log.jsonl"
 # Ensure directories exist
 MEMORY_DIR.mkdir(exist_ok=True)
 
+# Log handles are opened once and reused for every turn.
+# The LLM log is a raw O_APPEND fd: one os.write per entry, atomic for small writes.
+LLM_LOG_FD = os.open(LLM_LOG, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+PERF_LOG_FH = open(PERF_LOG, "a", buffering=1, encoding="utf-8")
+atexit.register(os.close, LLM_LOG_FD)
+atexit.register(PERF_LOG_FH.close)
+
+# Read-only tool calls from one assistant message are I/O-bound and run in parallel;
+# anything with side effects (pushes, PRs, approval prompts, reliability writes) runs in call order
+TOOL_POOL = ThreadPoolExecutor(max_workers=8)
+PARALLEL_SAFE_TOOLS = frozenset(IDEMPOTENT_TOOLS) | {"run_safe_shell", "github_check_pr_status", "github_check_ci_status"}
+LOG_LOCK = threading.Lock()  # guards writes to the shared log handles
+
+# Fields that are the same for every LLM call; per-call values are filled into a copy
+_LOG_TEMPLATE = {
+    "timestamp": None,
+    "turn_id": 0,
+    "model": MODEL,                    # from router
+    "endpoint": ENDPOINT_URL,
+    "messages_count": 0,
+    "input_tokens": None,
+    "output_tokens": None,
+    "temperature": TEMPERATURE,
+    "duration_sec": 0.0,
+    "tool_calls": [],
+    "success": True,
+    "error": None,
+    "goal_id": None,
+    "user_prompt": "",
+    "response": "",
+    "user_prompt_snippet": "",
+    "response_snippet": "",
+}
+
+def _snippet(text, limit=120):
+    text = text or ""
+    return text if len(text) <= limit else text[:limit] + "..."
+
 # ─── Goal Memory Helpers (stub – expand later) ─────────────────────────────
 def load_goals():
     if GOALS_FILE.exists():
-        with open(GOALS_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+        return orjson.loads(GOALS_FILE.read_bytes())
     return {"goals": [], "completed": [], "current_focus": None}
 
 def save_goals(data):
-    with open(GOALS_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+    # Indented on purpose: goals.json is tracked in git and edited by hand.
+    # Written to a temp file and renamed so a crash mid-write can't corrupt it.
+    payload = orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    tmp = GOALS_FILE.with_suffix(".json.tmp")
+    tmp.write_bytes(payload)
+    os.replace(tmp, GOALS_FILE)
 
 goal_memory = load_goals()
 
+GOALS_MESSAGE_INDEX = 1  # position of the goals overview in the message list
+
+def goals_message():
+    """System message carrying the current goals; rebuilt on its own when goals change."""
+    return {"role": "system", "content": "Current goals overview:\n" + json.dumps(goal_memory, separators=(",", ":"))}
+
 # ─── Tool Reliability Stub (expand later) ──────────────────────────────────
 def record_tool_reliability(tool_name, goal_id, success, helpfulness, notes=""):
     # Placeholder – implement full logic as discussed
     print(f"[Reliability] {tool_name} for goal {goal_id}: success={success}, helpfulness={helpfulness}")
     # TODO: append to RELIABILITY_FILE
 
-# ─── Simple Timing Decorator (for performance.log) ─────────────────────────
-def timed(label: str):
-    def decorator(func):
-        def wrapper(*args, **kwargs):
-            start = time.perf_counter()
-            result = func(*args, **kwargs)
-            elapsed = time.perf_counter() - start
-            with open(PERF_LOG, "a") as f:
-                f.write(f"{time.time()},{label},{elapsed:.3f}\n")
-            print(f"[TIMING] {label}: {elapsed:.3f}s")
-            return result
-        return wrapper
-    return decorator
+# ─── Simple Timing Helper (for performance.log) ────────────────────────────
+@contextlib.contextmanager
+def time_block(label: str):
+    """Time the enclosed block and append it to performance.log."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with LOG_LOCK:
+            PERF_LOG_FH.write(f"{time.time()},{label},{elapsed:.3f}\n")
+        print(f"[TIMING] {label}: {elapsed:.3f}s")
+
+# ─── Tool Call Execution ───────────────────────────────────────────────────
+@functools.lru_cache(maxsize=512)
+def _parse_args(arguments: str) -> tuple:
+    """Parse a tool-call arguments string; repeated identical calls skip the parse.
+    Returns items as a tuple so the cached value can't be mutated by callers."""
+    return tuple(orjson.loads(arguments).items())
+
+def run_tool_call(tool_call, current_focus=None):
+    """Execute one tool call from the assistant message. Returns (func_name, result)."""
+    func_name = tool_call["function"]["name"]
+    args = dict(_parse_args(tool_call["function"].get("arguments") or "{}"))
+
+    print(f"\n[Tool call] {func_name}({args})")
+
+    try:
+        with time_block(f"tool:{func_name}"):
+            result = execute_tool(func_name, args, current_goal_id=current_focus)
+        print("[Result]", result if len(result) <= 600 else result[:600] + "...")
+
+        # Auto-record reliability (stub – agent can refine later)
+        success = not looks_like_error(result)
+        helpfulness = 0.9 if success else 0.3  # placeholder
+        record_tool_reliability(func_name, current_focus, success, helpfulness)
+
+    except Exception as e:
+        result = f"Tool execution failed: {str(e)}"
+        print(result)
+
+    return func_name, result
+
+def run_tool_calls(tool_calls, current_focus=None):
+    """
+    Execute all tool calls of one assistant message; results keep call order.
+    Runs of read-only calls go to TOOL_POOL together, and every other call
+    waits for those to finish and then runs alone on this thread.
+    """
+    results = []
+    pending = []
+    for tc in tool_calls:
+        if tc["function"]["name"] in PARALLEL_SAFE_TOOLS:
+            pending.append(TOOL_POOL.submit(run_tool_call, tc, current_focus))
+            continue
+        results.extend(fut.result() for fut in pending)
+        pending = []
+        results.append(run_tool_call(tc, current_focus))
+    results.extend(fut.result() for fut in pending)
+    return results
+
+# ─── Streaming Helpers ─────────────────────────────────────────────────────
+def collect_stream(stream, messages):
+    """Echo content deltas as they arrive, then rebuild the full response."""
+    chunks = []
+    printed = False
+    for chunk in stream:
+        chunks.append(chunk)
+        if chunk.choices:
+            delta = chunk.choices[0].delta
+            if getattr(delta, "content", None):
+                print(delta.content, end="", flush=True)
+                printed = True
+    if printed:
+        print()
+    return stream_chunk_builder(chunks, messages=messages)
+
+# ─── History Compaction ────────────────────────────────────────────────────
+COMPACTION_MARKER = "Earlier conversation (compacted):"
+
+def truncate_middle(text: str, limit: int = MAX_TOOL_RESULT_CHARS) -> str:
+    """Keep the head and tail of long text; errors usually surface at either end."""
+    if len(text) <= limit:
+        return text
+    half = limit // 2
+    return f"{text[:half]}\n... [{len(text) - 2 * half} chars truncated] ...\n{text[-half:]}"
+
+def compact_history(messages, pinned=1):
+    """
+    Fold old turns into a single summary message once history grows past
+    MAX_TURNS_BEFORE_COMPACTION. The first `pinned` messages (system prompt)
+    are kept as-is, and the cut always lands on a user message so no tool
+    result is separated from the assistant call that requested it.
+    """
+    if len(messages) <= MAX_TURNS_BEFORE_COMPACTION:
+        return
+    cut = len(messages) - MAX_TURNS_BEFORE_COMPACTION // 2
+    while cut < len(messages) and messages[cut].get("role") != "user":
+        cut += 1
+    if cut >= len(messages):
+        return  # still inside a single long tool loop; try again next call
+
+    notes = []
+    for m in messages[pinned:cut]:
+        role = m.get("role")
+        content = m.get("content") or ""
+        if role == "system" and content.startswith(COMPACTION_MARKER):
+            notes.extend(content.splitlines()[1:])
+        elif role == "user":
+            notes.append(f"- user: {content[:200]}")
+        elif role == "tool":
+            notes.append(f"- tool {m.get('name')}: {content[:120]!r}")
+
+    summary = {"role": "system", "content": "\n".join([COMPACTION_MARKER] + notes[-30:])}
+    messages[pinned:cut] = [summary]
+    print(f"[Compaction] folded {cut - pinned} messages into a summary")
+
+# ─── Input Reader & Idle Maintenance ───────────────────────────────────────
+MAINTENANCE_INTERVAL = 30.0  # idle seconds before the first maintenance pass
+MAINTENANCE_MAX_PASSES = 3   # per idle period; each wait is twice the previous one
+
+_input_queue = queue.Queue()
+_want_input = threading.Event()
+
+def _stdin_reader():
+    """
+    Reads one line per request from the main loop. Only prompts when asked,
+    so tool confirmations (config.APPROVAL_CALLBACK) never compete for stdin.
+    """
+    while True:
+        _want_input.wait()
+        _want_input.clear()
+        try:
+            line = input("> ")
+        except EOFError:
+            line = "quit"
+        _input_queue.put(line)
+
+def run_background_maintenance():
+    """Warm the PR and tool caches with read-only lookups while the user is thinking."""
+    try:
+        for goal in goal_memory.get("goals", []):
+            pr = goal.get("linked_pr")
+            if pr and goal.get("status") != "completed":
+                args = {"pr_number_or_url": str(pr)}
+                execute_tool("github_check_pr_status", args, current_goal_id=goal.get("id"))
+                execute_tool("github_check_ci_status", args, current_goal_id=goal.get("id"))
+        execute_tool("list_tool_reliability", {})
+    except Exception as e:
+        print(f"[Maintenance] skipped: {e}")
+
+def _maintenance_worker(stop):
+    """Run a few maintenance passes with doubling gaps, until `stop` is set."""
+    interval = MAINTENANCE_INTERVAL
+    for _ in range(MAINTENANCE_MAX_PASSES):
+        if stop.wait(interval):
+            return
+        run_background_maintenance()
+        interval *= 2
+
+def read_user_input():
+    """Wait for the next input line; maintenance runs on a worker while we wait."""
+    stop = threading.Event()
+    threading.Thread(target=_maintenance_worker, args=(stop,), daemon=True).start()
+    _want_input.set()
+    try:
+        return _input_queue.get()
+    finally:
+        stop.set()
+
+def shutdown():
+    """Persist goals and let background pushes finish before exiting."""
+    push_error = wait_for_pending_pushes()
+    if push_error:
+        print(f"[Shutdown] background push failed:\n{push_error}")
+    save_goals(goal_memory)
 
 # ─── Main Agent Loop ───────────────────────────────────────────────────────
 def main():
     print(f"Agent starting in {os.getcwd()}")
     print(f"Model: {MODEL} | Temp: {TEMPERATURE} | Automerge: {ENABLE_AUTOMERGE}")
 
-    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
-
-    # Optional: inject current goals / repo map into first message
-    messages[0]["content"] += f"\n\nCurrent goals overview:\n{json.dumps(goal_memory, indent=2)}"
+    # SYSTEM_PROMPT stays untouched and byte-identical every turn (cacheable prefix);
+    # goal state lives in its own message that is swapped when goals change
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}, goals_message()]
 
     print("\nAgent ready. Type your request (or 'quit'):\n")
     
     turn_count = 0
+    threading.Thread(target=_stdin_reader, daemon=True).start()
 
     while True:
         try:
-            user_input = input("> ").strip()
+            user_input = read_user_input().strip()
             if user_input.lower() in ("quit", "exit", "q"):
                 print("Shutting down agent.")
-                save_goals(goal_memory)
+                shutdown()
                 sys.exit()
             if not user_input:
                 continue
 
+            messages[GOALS_MESSAGE_INDEX] = goals_message()
             messages.append({"role": "user", "content": user_input})
             turn_count += 1
 
             while True:
-                # Optional: compact history if too long (future)
-                # if turn_count % 40 == 0:
-                #     summarize_and_restart_context(messages)
+                compact_history(messages, pinned=GOALS_MESSAGE_INDEX + 1)
 
-                start_time = time.time()
-                call_time = datetime.now(timezone.utc).isoformat()
+                # One wall stamp per call (formatted only when logged); perf_counter for duration
+                start_wall = time.time()
+                start_perf = time.perf_counter()
 
                 os.environ['GRADIENT_AI_API_KEY'] = BEARER_TOKEN
-                response = completion(
+                stream = completion(
                     model="gradient_ai/" + MODEL,  # or custom provider
                     messages=messages,
-                    tools=ALL_TOOLS,
+                    tools=ALL_TOOLS_COMPACT,
                     tool_choice="auto",
                     temperature=TEMPERATURE,
+                    stream=True,
+                    stream_options={"include_usage": True},
                     drop_params=True,           # ← tells litellm to be more lenient
                 )
+                response = collect_stream(stream, messages)
 
                 msg = {}
 
@@ -146,64 +375,46 @@ def main():
                         except json.JSONDecodeError:
                             pass
                 
-                duration = time.time() - start_time
-                log_entry = {
-                    "timestamp": call_time,
-                    "turn_id": turn_count,
-                    "model": MODEL,                    # from router
-                    "endpoint": ENDPOINT_URL,
-                    "messages_count": len(messages),
-                    "input_tokens": response.usage.prompt_tokens if hasattr(response.usage, 'prompt_tokens') else None,
-                    "output_tokens": response.usage.completion_tokens if hasattr(response.usage, 'completion_tokens') else None,
-                    "temperature": TEMPERATURE,
-                    "duration_sec": round(duration, 3),
-                    "tool_calls": msg.get("tool_calls", []),
-                    "success": True,
-                    "error": None,
-                    "goal_id": goal_memory.get("current_focus"),
-                    "user_prompt": messages[-1]["content"] if messages else "",
-                    "response": msg["content"] if "content" in msg else ""
-                }
-
-                with open(LLM_LOG, "a", encoding="utf-8") as f:
-                    f.write(json.dumps(log_entry) + "\n")
+                duration = time.perf_counter() - start_perf
+                current_focus = goal_memory.get("current_focus")  # invariant for the rest of this turn
+                usage = response.usage
+                prompt_text = messages[-1]["content"] if messages else ""
+                response_text = msg.content or ""
+                log_entry = _LOG_TEMPLATE.copy()
+                log_entry["timestamp"] = datetime.fromtimestamp(start_wall, tz=timezone.utc).isoformat(timespec="milliseconds")
+                log_entry["turn_id"] = turn_count
+                log_entry["messages_count"] = len(messages)
+                log_entry["input_tokens"] = getattr(usage, "prompt_tokens", None)
+                log_entry["output_tokens"] = getattr(usage, "completion_tokens", None)
+                log_entry["duration_sec"] = round(duration, 3)
+                log_entry["tool_calls"] = msg.get("tool_calls", [])
+                log_entry["goal_id"] = current_focus
+                log_entry["user_prompt"] = prompt_text
+                log_entry["response"] = response_text
+                log_entry["user_prompt_snippet"] = _snippet(prompt_text)
+                log_entry["response_snippet"] = _snippet(response_text)
+
+                os.write(LLM_LOG_FD, (json.dumps(log_entry, separators=(",", ":")) + "\n").encode("utf-8"))
+                invalidate_tool_cache("summarize_llm_logs", "query_llm_logs")  # log just grew
 
                 messages.append(msg)
 
                 if not msg["tool_calls"]:
-                    print("(Done) Response: \n" + msg["content"])
+                    print("(Done)")  # content was already streamed to stdout
                     break
                 
-                for tool_call in msg["tool_calls"]:
-                    tool_call_id = tool_call["id"]
-                    func_name = tool_call["function"]["name"]
-                    args = json.loads(tool_call["function"].get("arguments", "{}"))
-
-                    print(f"\n[Tool call] {func_name}({args})")
-
-                    try:
-                        # Timed execution
-                        @timed(f"tool:{func_name}")
-                        def run():
-                            return execute_tool(func_name, args, current_goal_id=goal_memory.get("current_focus"))
-
-                        result = run()
-                        print(f"[Result] {result[:600]}{'...' if len(result) > 600 else ''}")
-
-                        # Auto-record reliability (stub – agent can refine later)
-                        success = "error" not in result.lower()
-                        helpfulness = 0.9 if success else 0.3  # placeholder
-                        record_tool_reliability(func_name, goal_memory.get("current_focus"), success, helpfulness)
-
-                    except Exception as e:
-                        result = f"Tool execution failed: {str(e)}"
-                        print(result)
+                tool_calls = msg["tool_calls"]
+                if len(tool_calls) == 1:
+                    results = [run_tool_call(tool_calls[0], current_focus)]
+                else:
+                    results = run_tool_calls(tool_calls, current_focus)
 
+                for tool_call, (func_name, result) in zip(tool_calls, results):
                     messages.append({
                         "role": "tool",
-                        "tool_call_id": tool_call_id,
+                        "tool_call_id": tool_call["id"],
                         "name": func_name,
-                        "content": result
+                        "content": truncate_middle(result)
                     })
 
                 # Optional: check for merged PRs and auto-advance goals
@@ -212,7 +423,7 @@ def main():
 
         except KeyboardInterrupt:
             print("\nInterrupted. Saving state...")
-            save_goals(goal_memory)
+            shutdown()
             break
         except Exception as e:
             print(f"Critical loop error: {e}")
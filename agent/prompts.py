@@ -1,8 +1,7 @@
 # agent/prompts.py
 """System prompt and prompt helpers."""
 
-import json
-from agent.tools import ALL_TOOLS
+from agent.tools import ALL_TOOLS_JSON
 
 SYSTEM_PROMPT = """
 TOOL USAGE RULES - FOLLOW EXACTLY:
@@ -67,4 +66,4 @@ Behavior:
 - When goal complete: suggest next pending goal or ask user.
 
 Available Tools:
-""" + json.dumps(ALL_TOOLS)
+""" + ALL_TOOLS_JSON
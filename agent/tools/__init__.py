@@ -1,24 +1,156 @@
 # defines:
 # ALL_TOOLS: list of tool JSON schemas
+# ALL_TOOLS_COMPACT / ALL_TOOLS_JSON: whitespace-trimmed copy and its cached JSON
 # execute_tool(name, args, current_goal_id=None): dispatcher that calls the real function and returns string result
+# looks_like_error(result): cheap failure check on a tool result
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+import orjson
 
 from .github import GITHUB_TOOLS, execute_github_tool
 from .llm_log_analyzer import LLM_LOG_TOOLS, execute_llm_log_tool
 from .reliability import RELIABILITY_TOOLS, execute_reliability_tool
 from .shell import SHELL_TOOLS, execute_shell_tool
 
-ALL_TOOLS = SHELL_TOOLS
-ALL_TOOLS.extend(GITHUB_TOOLS) # extend with other modules later
-ALL_TOOLS.extend(LLM_LOG_TOOLS)
-ALL_TOOLS.extend(RELIABILITY_TOOLS)
+# Module schema tuples are frozen at import; this is the combined list sent to the LLM
+ALL_TOOLS = [*SHELL_TOOLS, *GITHUB_TOOLS, *LLM_LOG_TOOLS, *RELIABILITY_TOOLS]  # extend with other modules later
+
+
+def _compact_schema(node):
+    """Copy of a schema with runs of whitespace in descriptions collapsed."""
+    if isinstance(node, dict):
+        return {
+            k: " ".join(v.split()) if k == "description" and isinstance(v, str) else _compact_schema(v)
+            for k, v in node.items()
+        }
+    if isinstance(node, list):
+        return [_compact_schema(v) for v in node]
+    return node
+
+
+# What actually goes over the wire each turn; built once at import
+ALL_TOOLS_COMPACT = _compact_schema(ALL_TOOLS)
+# ...and its serialized form, encoded once for the system prompt
+ALL_TOOLS_JSON = orjson.dumps(ALL_TOOLS_COMPACT).decode("utf-8")
+
+# Built once: tool name → module dispatcher
+_DISPATCH = {}
+for _tools, _executor in (
+    (SHELL_TOOLS, execute_shell_tool),
+    (GITHUB_TOOLS, execute_github_tool),
+    (LLM_LOG_TOOLS, execute_llm_log_tool),
+    (RELIABILITY_TOOLS, execute_reliability_tool),
+):
+    _DISPATCH.update(dict.fromkeys((t["function"]["name"] for t in _tools), _executor))
+
+# ─── Result Memoization ────────────────────────────────────────────────────
+# Read-only tools whose results can be reused → TTL in seconds (None = until invalidated).
+# Tools that write or have side effects (run_safe_shell, git/PR creation, recording) opt out.
+# The PR status/CI tools share github._PR_CACHE instead, so they don't stack a second TTL here.
+IDEMPOTENT_TOOLS = {
+    "summarize_llm_logs": 30.0,
+    "query_llm_logs": 30.0,
+    "list_tool_reliability": None,
+}
+# Writes that make cached results of other tools stale
+INVALIDATES = {
+    "record_tool_reliability": ("list_tool_reliability",),
+}
+
+# Cache-key projections: keep only the args that change a tool's result, so
+# incidental differences (whitespace, case, unused flags) still hit the cache.
+# A projection must never drop an argument the output depends on.
+KEY_PROJECTION = {
+    "query_llm_logs": lambda a: (tuple(a.get("filter_expr", "").lower().split()), a.get("limit", 20)),
+}
+
+
+@dataclass(slots=True)
+class ToolState:
+    """Memoized most recent call of one tool, held as plain attributes."""
+    last_args: Optional[object] = None
+    last_result: Optional[str] = None
+    last_expires: Optional[float] = None
+
+
+# Built once: tool name → position in ALL_TOOLS / TOOL_STATE.
+# Each tool keeps only its last call; the memoized tools are mostly re-asked the same thing.
+TOOL_INDEX = {t["function"]["name"]: i for i, t in enumerate(ALL_TOOLS)}
+TOOL_STATE = [ToolState() for _ in ALL_TOOLS]
+
+_CACHE_LOCK = threading.Lock()  # keeps the three ToolState fields consistent across pool threads
+
+
+def _cache_args(name, args):
+    projection = KEY_PROJECTION.get(name)
+    if projection is not None:
+        return projection(args)
+    return orjson.dumps(args, option=orjson.OPT_SORT_KEYS)
+
+
+def _cache_get(st, key_args):
+    with _CACHE_LOCK:
+        if st.last_result is None or st.last_args != key_args:
+            return None
+        if st.last_expires is not None and time.monotonic() >= st.last_expires:
+            return None
+        return st.last_result
+
+
+def _cache_put(st, key_args, value, ttl):
+    expires_at = time.monotonic() + ttl if ttl is not None else None
+    with _CACHE_LOCK:
+        st.last_args, st.last_result, st.last_expires = key_args, value, expires_at
+
+
+def invalidate_tool_cache(*names):
+    """Drop cached results for the given tools (all tools if none given)."""
+    with _CACHE_LOCK:
+        for name in names or TOOL_INDEX:
+            st = TOOL_STATE[TOOL_INDEX[name]]
+            st.last_args = st.last_result = st.last_expires = None
+
+
+_ERR_NEEDLES = ("error", "Error", "ERROR", "Traceback", "failed", "Failed")
+_ERR_SCAN_WINDOW = 8192  # errors surface in the first or last few KB of output
+
+
+def looks_like_error(result: str) -> bool:
+    """Cheap failure heuristic: literal needle search in the head and tail only (no copies)."""
+    tail_start = max(0, len(result) - _ERR_SCAN_WINDOW)
+    for needle in _ERR_NEEDLES:
+        if result.find(needle, 0, _ERR_SCAN_WINDOW) != -1 or result.find(needle, tail_start) != -1:
+            return True
+    return False
+
+
+# ─── Dispatcher ────────────────────────────────────────────────────────────
 
 def execute_tool(name: str, args: dict, current_goal_id=None):
-    if name in [t["function"]["name"] for t in RELIABILITY_TOOLS]:
-        return execute_reliability_tool(name, args, current_goal_id)
-    elif name in [t["function"]["name"] for t in LLM_LOG_TOOLS]:
-        return execute_llm_log_tool(name, args, current_goal_id)
-    elif name in [t["function"]["name"] for t in SHELL_TOOLS]:
-        return execute_shell_tool(name, args, current_goal_id)
-    elif name in [t["function"]["name"] for t in GITHUB_TOOLS]:
-        return execute_github_tool(name, args, current_goal_id)
-    return f"Tool '{name}' not implemented in any module yet."
+    if name in IDEMPOTENT_TOOLS:
+        st = TOOL_STATE[TOOL_INDEX[name]]
+        key_args = _cache_args(name, args)
+        cached = _cache_get(st, key_args)
+        if cached is not None:
+            return cached
+        result = _dispatch(name, args, current_goal_id)
+        # Failures (timeouts, gh errors) are not memoized so a retry actually retries
+        if not looks_like_error(result):
+            _cache_put(st, key_args, result, IDEMPOTENT_TOOLS[name])
+        return result
+
+    result = _dispatch(name, args, current_goal_id)
+    if name in INVALIDATES:
+        invalidate_tool_cache(*INVALIDATES[name])
+    return result
+
+
+def _dispatch(name: str, args: dict, current_goal_id=None):
+    executor = _DISPATCH.get(name)
+    if executor is None:
+        return f"Tool '{name}' not implemented in any module yet."
+    return executor(name, args, current_goal_id)
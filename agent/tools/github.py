@@ -1,14 +1,38 @@
 # agent/tools/github.py
 """
 GitHub-specific tools for the agent.
-Uses `gh` CLI for all operations (assumes `gh auth login` already done).
+Uses `gh` and `git` for branch and PR operations (assumes `gh auth login` already done).
+PR status and CI lookups are GraphQL queries sent straight to each host's API
+over a persistent connection, authenticated with the token `gh` holds for that host.
 """
 
+import atexit
+import os
+import random
+import shutil
 import subprocess
-import json
+import threading
+import time
 from typing import Dict, Any, Optional
 
-from agent.config import ENABLE_AUTOMERGE, CONFIRM_PR_CREATION
+import httpx
+import orjson
+
+from agent import config
+from agent.config import ENABLE_AUTOMERGE, GITHUB_CACHE_TTL
+
+# Executables resolved once at import instead of a $PATH walk per call
+_GH_PATH = shutil.which("gh")
+_GH = _GH_PATH or "gh"
+_GIT = shutil.which("git") or "git"
+
+if _GH_PATH is None and ENABLE_AUTOMERGE:
+    raise RuntimeError("ENABLE_AUTOMERGE is set but the GitHub CLI 'gh' is not on PATH. Install it or disable automerge.")
+
+def _decode(output: Optional[bytes]) -> str:
+    """Decode captured process output only when it is shown to the user."""
+    return (output or b"").decode("utf-8", "replace").strip()
+
 
 def execute_github_tool(tool_name: str, args: Dict[str, Any], current_goal_id: Optional[int] = None) -> str:
     """
@@ -16,7 +40,12 @@ def execute_github_tool(tool_name: str, args: Dict[str, Any], current_goal_id: O
     Called by the main driver.
     """
     if tool_name == "git_create_branch_and_push":
-        return git_create_branch_and_push(args.get("branch_name", ""))
+        # Branch/PR tools are never memoized, so failed background pushes are reported here
+        push_error = _reap_finished_pushes()
+        result = git_create_branch_and_push(args.get("branch_name", ""))
+        if push_error:
+            return f"Error: an earlier background push failed:\n{push_error}\n\n{result}"
+        return result
     
     elif tool_name == "github_create_pr":
         return github_create_pr(
@@ -26,13 +55,23 @@ def execute_github_tool(tool_name: str, args: Dict[str, Any], current_goal_id: O
             draft=args.get("draft", True)
         )
     
+    elif tool_name == "github_branch_and_pr":
+        return github_branch_and_pr(
+            branch_name=args.get("branch_name", ""),
+            title=args.get("title", ""),
+            body=args.get("body", ""),
+            base=args.get("base", "main"),
+            draft=args.get("draft", True)
+        )
+    
     elif tool_name == "github_check_pr_status":
         return github_check_pr_status(args.get("pr_number_or_url", ""))
     
     elif tool_name == "github_check_ci_status":
         return github_check_ci_status(
             pr_number_or_url=args.get("pr_number_or_url", ""),
-            watch=args.get("watch", False)
+            watch=args.get("watch", False),
+            verbose=args.get("verbose", False)
         )
     
     else:
@@ -41,27 +80,66 @@ def execute_github_tool(tool_name: str, args: Dict[str, Any], current_goal_id: O
 
 # ─── Individual Tool Implementations ────────────────────────────────────────
 
+# branch name → background `git push` started by git_create_branch_and_push
+_PENDING_PUSHES: Dict[str, subprocess.Popen] = {}
+# Failed pushes not yet reported; only the branch/PR tools and shutdown take these
+_FAILED_PUSHES: list = []
+
+
+def _collect_pushes(finished_only: bool) -> None:
+    """Reap background pushes (all, or only those already done), keeping a record of failures."""
+    for branch_name, proc in list(_PENDING_PUSHES.items()):
+        if finished_only and proc.poll() is None:
+            continue
+        if _PENDING_PUSHES.pop(branch_name, None) is None:
+            continue  # reaped by another caller
+        stdout, stderr = proc.communicate()
+        if proc.returncode != 0:
+            _FAILED_PUSHES.append(f"git push {branch_name} (rc={proc.returncode}):\n{_decode(stderr or stdout)}")
+
+
+def _take_push_failures() -> Optional[str]:
+    report = "\n".join(_FAILED_PUSHES) or None
+    _FAILED_PUSHES.clear()
+    return report
+
+
+def _reap_finished_pushes() -> Optional[str]:
+    """Reap pushes that are done without waiting. Returns git's error output for any unreported failure."""
+    _collect_pushes(finished_only=True)
+    return _take_push_failures()
+
+
+def wait_for_pending_pushes() -> Optional[str]:
+    """Block until background pushes finish. Returns git's error output for any unreported failure."""
+    _collect_pushes(finished_only=False)
+    return _take_push_failures()
+
+
 def git_create_branch_and_push(branch_name: str) -> str:
     """Create a new branch and push it to origin."""
     if not branch_name:
         return "Error: branch_name required"
 
-    if CONFIRM_PR_CREATION:  # reuse for branch safety
-        confirm = input(f"Create & push branch '{branch_name}'? [y/N]: ").strip().lower()
-        if confirm not in ("y", "yes"):
-            return "Branch creation aborted by user."
+    if not config.request_approval(f"Create & push branch '{branch_name}'?", branch_name):
+        return "Branch creation aborted by user."
 
     try:
         # Create and checkout
-        subprocess.run(["git", "checkout", "-b", branch_name], check=True, capture_output=True, text=True)
-        # Push with upstream tracking
-        result = subprocess.run(
-            ["git", "push", "--set-upstream", "origin", branch_name],
-            capture_output=True, text=True, check=True
+        subprocess.run([_GIT, "checkout", "-b", branch_name], check=True, capture_output=True)
+        # Push with upstream tracking in the background; github_create_pr waits for it
+        _PENDING_PUSHES[branch_name] = subprocess.Popen(
+            [_GIT, "push", "--set-upstream", "origin", branch_name],
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+        invalidate_pr_cache()
+        return (
+            f"Branch '{branch_name}' created and checked out.\n"
+            f"Push to origin started in the background and is NOT confirmed yet; "
+            f"a failure is reported by the next branch/PR tool call, and github_create_pr waits for it."
         )
-        return f"Branch '{branch_name}' created and pushed successfully.\n{result.stdout.strip()}"
     except subprocess.CalledProcessError as e:
-        return f"Git command failed:\n{ e.stderr or e.stdout }"
+        return f"Git command failed:\n{_decode(e.stderr or e.stdout)}"
     except Exception as e:
         return f"Unexpected error: {str(e)}"
 
@@ -71,40 +149,270 @@ def github_create_pr(title: str, body: str, base: str = "main", draft: bool = Tr
     if not title or not body:
         return "Error: title and body required"
 
-    if CONFIRM_PR_CREATION:
-        confirm = input(f"Create PR '{title}' (draft={draft})? [y/N]: ").strip().lower()
-        if confirm not in ("y", "yes"):
-            return "PR creation aborted by user."
+    if not config.request_approval(f"Create PR '{title}' (draft={draft})?", title):
+        return "PR creation aborted by user."
+
+    push_error = wait_for_pending_pushes()
+    if push_error:
+        return f"Push failed, PR not created:\n{push_error}"
 
-    cmd = ["gh", "pr", "create", "--title", title, "--body", body, "--base", base]
+    cmd = [_GH, "pr", "create", "--title", title, "--body", body, "--base", base]
     if draft:
         cmd.append("--draft")
     if ENABLE_AUTOMERGE:
         cmd.extend(["--auto", "--squash"])  # or --merge if preferred
 
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        url = result.stdout.strip()
+        result = subprocess.run(cmd, capture_output=True, check=True)
+        url = _decode(result.stdout)
+        invalidate_pr_cache()
         return f"PR created successfully!\nURL: {url}"
     except subprocess.CalledProcessError as e:
-        return f"gh pr create failed:\n{ e.stderr or e.stdout }"
+        return f"gh pr create failed:\n{_decode(e.stderr or e.stdout)}"
     except FileNotFoundError:
         return "Error: GitHub CLI 'gh' not found. Please install it."
     except Exception as e:
         return f"Unexpected error: {str(e)}"
 
 
+def github_branch_and_pr(branch_name: str, title: str, body: str, base: str = "main", draft: bool = True) -> str:
+    """Create a branch, push it and open a PR in one step, with a single confirmation."""
+    if not branch_name or not title or not body:
+        return "Error: branch_name, title and body required"
+
+    prompt = f"Create & push branch '{branch_name}' and open PR '{title}' (draft={draft})?"
+    if not config.request_approval(prompt, branch_name, title):
+        return "Branch + PR creation aborted by user."
+
+    push_error = wait_for_pending_pushes()
+    if push_error:
+        return f"Earlier push failed, nothing created:\n{push_error}"
+
+    try:
+        # check=False: expected failures (branch exists, push rejected) are reported, not raised
+        checkout = subprocess.run([_GIT, "checkout", "-b", branch_name], capture_output=True)
+        if checkout.returncode != 0:
+            return f"Git command failed:\n{_decode(checkout.stderr or checkout.stdout)}"
+
+        push = subprocess.run(
+            [_GIT, "push", "--set-upstream", "origin", branch_name], capture_output=True
+        )
+        if push.returncode != 0:
+            return f"Branch '{branch_name}' created but push failed, PR not created:\n{_decode(push.stderr or push.stdout)}"
+
+        cmd = [_GH, "pr", "create", "--head", branch_name, "--title", title, "--body", body, "--base", base]
+        if draft:
+            cmd.append("--draft")
+        if ENABLE_AUTOMERGE:
+            cmd.extend(["--auto", "--squash"])  # or --merge if preferred
+        pr = subprocess.run(cmd, capture_output=True)
+        invalidate_pr_cache()
+        if pr.returncode != 0:
+            return f"Branch '{branch_name}' pushed but gh pr create failed:\n{_decode(pr.stderr or pr.stdout)}"
+        return f"Branch '{branch_name}' pushed and PR created successfully!\nURL: {_decode(pr.stdout)}"
+    except FileNotFoundError as e:
+        return f"Error: executable not found: {e.filename}"
+    except Exception as e:
+        return f"Unexpected error: {str(e)}"
+
+
+# ─── PR status + CI via one GraphQL query ───────────────────────────────────
+
+# Only what the summaries print; `number` comes from the request and `merged` from state
+_PR_VIEW_FIELDS = "title state mergeable baseRefName headRefName autoMergeRequest { enabledAt }"
+
+_PR_BUNDLE_QUERY = """
+query($owner: String!, $repo: String!, $number: Int!) {
+  repository(owner: $owner, name: $repo) {
+    pullRequest(number: $number) {
+      %s
+      commits(last: 1) { nodes { commit { statusCheckRollup { contexts(first: 100) { nodes {
+        __typename
+        ... on CheckRun { name status conclusion }
+        ... on StatusContext { context state }
+      } } } } } }
+    }
+  }
+}
+""" % _PR_VIEW_FIELDS
+
+# PR ref → (fetched_at, bundle); shared by the status and CI tools, reused for GITHUB_CACHE_TTL seconds
+_PR_CACHE: Dict[str, tuple] = {}
+# branch name → URL of its PR, looked up once per branch
+_BRANCH_PRS: Dict[str, str] = {}
+
+
+def invalidate_pr_cache() -> None:
+    """Forget cached PR/CI state (after pushing or opening a PR)."""
+    _PR_CACHE.clear()
+    _BRANCH_PRS.clear()
+
+
+# Host used by `gh` outside a repo context; github.com unless GH_HOST points at an Enterprise server
+_DEFAULT_HOST = os.getenv("GH_HOST") or "github.com"
+
+
+def _graphql_url(host: str) -> str:
+    return "https://api.github.com/graphql" if host == "github.com" else f"https://{host}/api/graphql"
+
+
+class _GraphQLClients:
+    """
+    Pool of long-lived httpx GraphQL clients, one per GitHub host. `gh` is
+    only run lazily, to read each host's auth token and the current repo's
+    URL; every query then reuses that host's keep-alive HTTPS connection.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients: Dict[str, httpx.Client] = {}
+        self._repo: Optional[tuple] = None
+
+    def _ensure_client(self, host: str) -> httpx.Client:
+        with self._lock:
+            client = self._clients.get(host)
+            if client is None:
+                # Same precedence as gh: env tokens for the host's kind, then gh's stored token
+                if host == "github.com":
+                    token = os.getenv("GH_TOKEN") or os.getenv("GITHUB_TOKEN")
+                else:
+                    token = os.getenv("GH_ENTERPRISE_TOKEN") or os.getenv("GITHUB_ENTERPRISE_TOKEN")
+                if not token:
+                    token = subprocess.run(
+                        [_GH, "auth", "token", "--hostname", host], capture_output=True, check=True
+                    ).stdout.decode().strip()
+                client = self._clients[host] = httpx.Client(
+                    headers={"Authorization": f"bearer {token}"},
+                    timeout=httpx.Timeout(30.0, connect=5.0),
+                )
+            return client
+
+    def default_repo(self) -> tuple:
+        """(host, owner, name) of the repo in the current directory, resolved once."""
+        with self._lock:
+            if self._repo is None:
+                # --jq makes gh emit the repo URL as plain text; no JSON to parse here
+                result = subprocess.run(
+                    [_GH, "repo", "view", "--json", "url", "--jq", ".url"],
+                    capture_output=True, check=True
+                )
+                self._repo = _split_repo_path(_decode(result.stdout))
+            return self._repo
+
+    def call(self, host: str, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+        response = self._ensure_client(host).post(
+            _graphql_url(host), json={"query": query, "variables": variables}
+        )
+        response.raise_for_status()
+        payload = orjson.loads(response.content)
+        if payload.get("errors"):
+            raise RuntimeError("; ".join(e.get("message", "unknown error") for e in payload["errors"]))
+        return payload["data"]
+
+    def close(self) -> None:
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients.clear()
+
+
+_GRAPHQL = _GraphQLClients()
+atexit.register(_GRAPHQL.close)
+
+
+def _graphql(host: str, query: str, variables: Dict[str, Any]) -> Dict[str, Any]:
+    """Run a GraphQL query against `host` and return the `data` object."""
+    return _GRAPHQL.call(host, query, variables)
+
+
+def _split_repo_path(path: str) -> tuple:
+    """(host, owner, repo) from "https://host/owner/repo"; a bare "owner/repo" gets the default host."""
+    parts = path.split("://")[-1].strip("/").split("/")
+    host = parts[-3] if len(parts) >= 3 else _DEFAULT_HOST
+    return host, parts[-2], parts[-1]
+
+
+def _pr_url_for_branch(branch_name: str) -> str:
+    """URL of the PR whose head is `branch_name`, as `gh pr view <branch>` resolves it."""
+    url = _BRANCH_PRS.get(branch_name)
+    if url is None:
+        result = subprocess.run(
+            [_GH, "pr", "view", branch_name, "--json", "url", "--jq", ".url"],
+            capture_output=True, check=True
+        )
+        url = _BRANCH_PRS[branch_name] = _decode(result.stdout)
+    return url
+
+
+def _parse_pr_ref(pr_number_or_url: str) -> tuple:
+    """
+    Split a PR number, URL or branch name into (host, owner, repo, number).
+    Bare numbers use the current repo; branch names are resolved to their PR.
+    """
+    ref = pr_number_or_url.strip().lstrip("#")
+    if not ref.isdigit() and "/pull/" not in ref:
+        ref = _pr_url_for_branch(ref)
+    if "/pull/" in ref:
+        repo_path, _, number = ref.partition("/pull/")
+        return (*_split_repo_path(repo_path), int(number.split("/")[0]))
+    return (*_GRAPHQL.default_repo(), int(ref))
+
+
+def _normalize_check(node: Dict[str, Any]) -> Dict[str, str]:
+    """Map CheckRun / StatusContext nodes onto {name, state} like `gh pr checks`."""
+    if node.get("__typename") == "CheckRun":
+        state = node.get("conclusion") if node.get("status") == "COMPLETED" else "PENDING"
+        return {"name": node.get("name"), "state": state or "UNKNOWN"}
+    state = node.get("state") or "UNKNOWN"
+    return {"name": node.get("context"), "state": "PENDING" if state == "EXPECTED" else state}
+
+
+def _fetch_pr_bundle(pr_number_or_url: str, refresh: bool = False) -> Dict[str, Any]:
+    """Fetch PR metadata and its CI checks in one call; reused for GITHUB_CACHE_TTL seconds."""
+    key = pr_number_or_url.strip()
+    hit = _PR_CACHE.get(key)
+    if hit and not refresh and time.monotonic() - hit[0] < GITHUB_CACHE_TTL:
+        return hit[1]
+
+    host, owner, repo, number = _parse_pr_ref(key)
+    data = _graphql(host, _PR_BUNDLE_QUERY, {"owner": owner, "repo": repo, "number": number})
+    pr = data["repository"]["pullRequest"]
+    pr["number"] = number
+    pr["merged"] = pr.get("state") == "MERGED"
+    commits = pr.pop("commits", {}).get("nodes") or []
+    rollup = commits[0]["commit"].get("statusCheckRollup") if commits else None
+    nodes = rollup["contexts"]["nodes"] if rollup else []
+    pr["checks"] = [_normalize_check(n) for n in nodes]
+
+    _PR_CACHE[key] = (time.monotonic(), pr)
+    return pr
+
+
+def _poll_ci(pr_number_or_url: str, max_wait: float = 1800.0, stop_on_failure: bool = False) -> list:
+    """
+    Re-fetch the PR's checks until none are pending, sleeping 2 s → 4 s → 8 s …
+    (capped at 30 s, ±20% jitter) between polls. Returns the last checks seen.
+    With stop_on_failure, returns as soon as any check has failed.
+    """
+    delay = 2.0
+    deadline = time.monotonic() + max_wait
+    while True:
+        checks = _fetch_pr_bundle(pr_number_or_url, refresh=True)["checks"]
+        if not any(c.get("state") == "PENDING" for c in checks) or time.monotonic() >= deadline:
+            return checks
+        if stop_on_failure and _first_failed(checks) is not None:
+            return checks
+        time.sleep(min(delay * random.uniform(0.8, 1.2), max(0.0, deadline - time.monotonic())))
+        delay = min(delay * 2, 30.0)
+
+
 def github_check_pr_status(pr_number_or_url: str) -> str:
     """Get current status of a PR (open/merged/closed, mergeable, etc.)."""
     if not pr_number_or_url:
         return "Error: pr_number_or_url required"
 
     try:
-        result = subprocess.run(
-            ["gh", "pr", "view", pr_number_or_url, "--json", "state,title,number,merged,mergeable,baseRefName,headRefName,autoMergeRequest"],
-            capture_output=True, text=True, check=True
-        )
-        data = json.loads(result.stdout)
+        data = _fetch_pr_bundle(pr_number_or_url)
         summary = (
             f"PR #{data.get('number')} - {data.get('title')}\n"
             f"State: {data['state']}\n"
@@ -115,25 +423,39 @@ def github_check_pr_status(pr_number_or_url: str) -> str:
         )
         return summary
     except subprocess.CalledProcessError as e:
-        return f"Failed to fetch PR status:\n{ e.stderr or e.stdout }"
-    except json.JSONDecodeError:
+        return f"Failed to fetch PR status:\n{_decode(e.stderr or e.stdout)}"
+    except (orjson.JSONDecodeError, KeyError, TypeError):
         return "Failed to parse gh output"
     except Exception as e:
         return f"Error: {str(e)}"
 
 
-def github_check_ci_status(pr_number_or_url: str, watch: bool = False) -> str:
-    """Check CI status of a PR. Can watch until complete."""
+_OK_STATES = ("SUCCESS", "SKIPPED", "NEUTRAL", "PENDING")
+
+
+def _first_failed(checks: list) -> Optional[Dict[str, str]]:
+    return next((c for c in checks if (c.get("conclusion") or c.get("state")) not in _OK_STATES), None)
+
+
+def github_check_ci_status(pr_number_or_url: str, watch: bool = False, verbose: bool = False) -> str:
+    """Check CI status of a PR. Can watch until complete. Stops at the first failed check unless verbose."""
     if not pr_number_or_url:
         return "Error: pr_number_or_url required"
 
-    cmd = ["gh", "pr", "checks", pr_number_or_url, "--json", "name,state,conclusion"]
-    if watch:
-        cmd.append("--watch")
-
     try:
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        checks = json.loads(result.stdout)
+        if watch:
+            checks = _poll_ci(pr_number_or_url, stop_on_failure=not verbose)
+        else:
+            checks = _fetch_pr_bundle(pr_number_or_url)["checks"]
+
+        if not verbose:
+            failed = _first_failed(checks)
+            if failed is not None:
+                state = failed.get("conclusion") or failed.get("state")
+                return (
+                    f"CI Status:\n- {failed['name']}: {state}\n"
+                    f"\n→ Some checks FAILED ({len(checks)} checks total; use verbose=True for the full list)"
+                )
         
         summary_lines = ["CI Status:"]
         all_passed = True
@@ -156,19 +478,19 @@ def github_check_ci_status(pr_number_or_url: str, watch: bool = False) -> str:
         
         return "\n".join(summary_lines)
     except subprocess.CalledProcessError as e:
-        return f"CI check failed:\n{ e.stderr or e.stdout }"
+        return f"CI check failed:\n{_decode(e.stderr or e.stdout)}"
     except Exception as e:
         return f"Error checking CI: {str(e)}"
 
 
 # ─── Tool Schemas (exported for ALL_TOOLS list) ─────────────────────────────
 
-GITHUB_TOOLS = [
+GITHUB_TOOLS = (
     {
         "type": "function",
         "function": {
             "name": "git_create_branch_and_push",
-            "description": "Create a new git branch and push it to origin. Use semantic names like feat/add-login.",
+            "description": "Create a new git branch and push it to origin. Use semantic names like feat/add-login. Prefer github_branch_and_pr when you will open a PR right away.",
             "parameters": {
                 "type": "object",
                 "properties": {
@@ -182,7 +504,7 @@ GITHUB_TOOLS = [
         "type": "function",
         "function": {
             "name": "github_create_pr",
-            "description": "Create a GitHub Pull Request. Draft by default. Automerge only if flag enabled.",
+            "description": "Create a GitHub Pull Request. Draft by default. Automerge only if flag enabled. Prefer github_branch_and_pr for a new branch.",
             "parameters": {
                 "type": "object",
                 "properties": {
@@ -195,6 +517,24 @@ GITHUB_TOOLS = [
             }
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "github_branch_and_pr",
+            "description": "Create a branch, push it and open a PR in one step (one confirmation). Draft by default. Use semantic branch names like feat/add-login.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "branch_name": {"type": "string", "description": "Branch name"},
+                    "title": {"type": "string"},
+                    "body": {"type": "string"},
+                    "base": {"type": "string", "default": "main"},
+                    "draft": {"type": "boolean", "default": True}
+                },
+                "required": ["branch_name", "title", "body"]
+            }
+        }
+    },
     {
         "type": "function",
         "function": {
@@ -203,7 +543,7 @@ GITHUB_TOOLS = [
             "parameters": {
                 "type": "object",
                 "properties": {
-                    "pr_number_or_url": {"type": "string"}
+                    "pr_number_or_url": {"type": "string", "description": "PR number, URL or branch name"}
                 },
                 "required": ["pr_number_or_url"]
             }
@@ -217,11 +557,12 @@ GITHUB_TOOLS = [
             "parameters": {
                 "type": "object",
                 "properties": {
-                    "pr_number_or_url": {"type": "string"},
-                    "watch": {"type": "boolean", "default": False}
+                    "pr_number_or_url": {"type": "string", "description": "PR number, URL or branch name"},
+                    "watch": {"type": "boolean", "default": False},
+                    "verbose": {"type": "boolean", "default": False, "description": "List every check even after one has failed"}
                 },
                 "required": ["pr_number_or_url"]
             }
         }
-    }
-]
+    },
+)
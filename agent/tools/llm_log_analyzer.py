@@ -162,7 +162,7 @@ def query_llm_logs(filter_expr: str = "", limit: int = 20) -> str:
 
 # ─── Tool Schemas ──────────────────────────────────────────────────────────
 
-LLM_LOG_TOOLS = [
+LLM_LOG_TOOLS = (
     {
         "type": "function",
         "function": {
@@ -190,5 +190,5 @@ LLM_LOG_TOOLS = [
                 }
             }
         }
-    }
-    ]
+    },
+)
@@ -52,7 +52,8 @@ def save_reliability_data(data: Dict):
     """Save updated reliability stats."""
     RELIABILITY_FILE.parent.mkdir(parents=True, exist_ok=True)
     with open(RELIABILITY_FILE, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2)
+        # Indented on purpose: like goals.json, this file is tracked in git
+        f.write(json.dumps(data, indent=2))
 
 
 def record_tool_reliability(
@@ -155,7 +156,7 @@ def list_tool_reliability(goal_id: Optional[int] = None, include_global: bool =
 
 # ─── Tool Schemas ──────────────────────────────────────────────────────────
 
-RELIABILITY_TOOLS = [
+RELIABILITY_TOOLS = (
     {
         "type": "function",
         "function": {
@@ -187,5 +188,5 @@ RELIABILITY_TOOLS = [
                 }
             }
         }
-    }
-]
+    },
+)
@@ -4,9 +4,12 @@ Safe, read-only shell execution tools for the agent.
 All commands are restricted to inspection/listing/search operations.
 """
 
+import collections
+import functools
 import os
 import subprocess
 import shlex
+import threading
 from typing import Dict, Any, Optional
 
 ALLOWED_PREFIXES = [
@@ -14,6 +17,37 @@ ALLOWED_PREFIXES = [
     "git status", "git diff", "git log", "git branch", "git remote"
 ]
 
+# Allowed leading tokens, e.g. ("ls",) or ("git", "status") – checked by set lookup
+_ALLOWED_HEADS = frozenset(tuple(p.split()) for p in ALLOWED_PREFIXES)
+
+# Working directory for commands, cached instead of a getcwd() per call.
+# Anything that chdirs must call refresh_cwd() afterwards.
+_CWD = os.getcwd()
+
+
+def refresh_cwd() -> None:
+    global _CWD
+    _CWD = os.getcwd()
+
+
+_SHLEX_CHARS = ("\"", "'", "\\")
+
+
+@functools.lru_cache(maxsize=256)
+def _tokenize(cmd: str) -> tuple:
+    """
+    Split a command once; the agent often repeats the same command.
+    Plain commands (no quotes or escapes) split identically with str.split,
+    so shlex's pure-Python lexer only runs when it is actually needed.
+    """
+    if any(c in cmd for c in _SHLEX_CHARS):
+        return tuple(shlex.split(cmd))
+    return tuple(cmd.split())
+
+
+def _is_allowed(tokens: tuple) -> bool:
+    return tokens[:1] in _ALLOWED_HEADS or tokens[:2] in _ALLOWED_HEADS
+
 def execute_shell_tool(tool_name: str, args: Dict[str, Any], current_goal_id: Optional[int] = None) -> str:
     """
     Dispatcher for shell-related tools.
@@ -31,16 +65,20 @@ def run_safe_shell(cmd: str) -> str:
     - Only allows whitelisted command prefixes
     - Uses shlex for safe quoting
     - 10-second timeout
-    - Captures stdout/stderr
+    - Captures stdout/stderr (head + tail kept, runaway output stopped)
     """
     if not cmd.strip():
         return "Error: empty command"
 
-    # Basic prefix check (first word)
-    first_word = shlex.split(cmd)[0] if cmd.strip() else ""
-    allowed = any(cmd.strip().startswith(prefix) for prefix in ALLOWED_PREFIXES)
+    try:
+        cmd_list = _tokenize(cmd)
+    except ValueError as e:
+        return f"Error: could not parse command ({e}): {cmd}"
+
+    # Whitelist check on the first one or two words
+    first_word = cmd_list[0] if cmd_list else ""
 
-    if not allowed:
+    if not _is_allowed(cmd_list):
         return (
             f"Error: Command not allowed for safety reasons.\n"
             f"Allowed prefixes: {', '.join(ALLOWED_PREFIXES)}\n"
@@ -49,22 +87,16 @@ def run_safe_shell(cmd: str) -> str:
 
     try:
         # Use shell=False + list for better security
-        cmd_list = shlex.split(cmd)
-        result = subprocess.run(
-            cmd_list,
-            shell=False,
-            capture_output=True,
-            text=True,
-            timeout=10,
-            cwd=os.getcwd()
-        )
+        result = _run_capped(list(cmd_list), timeout=10, cwd=_CWD)
 
         output = f"stdout:\n{result.stdout.strip()}\n"
         if result.stderr:
             output += f"stderr:\n{result.stderr.strip()}\n"
+        if result.killed:
+            output += f"(output exceeded {MAX_OUTPUT_BYTES // (1024 * 1024)} MB; command was stopped)\n"
         output += f"return code: {result.returncode}"
 
-        if result.returncode != 0:
+        if result.returncode != 0 and not result.killed:
             return f"Command failed (rc={result.returncode}):\n{output}"
         
         return output or "(no output)"
@@ -79,9 +111,101 @@ def run_safe_shell(cmd: str) -> str:
         return f"Unexpected shell error: {str(e)}"
 
 
+# ─── Bounded Output Capture ────────────────────────────────────────────────
+
+KEEP_BYTES = 64 * 1024                 # kept from both the start and the end of each stream
+MAX_OUTPUT_BYTES = 16 * 1024 * 1024    # stop the command once it has produced this much
+
+
+class _CappedBuffer:
+    """Keeps the first and last KEEP_BYTES of a stream; the middle is dropped."""
+
+    def __init__(self, keep: int = KEEP_BYTES):
+        self.keep = keep
+        self.head = bytearray()
+        self.tail = collections.deque()
+        self.tail_len = 0
+        self.total = 0
+
+    def feed(self, chunk: bytes) -> None:
+        self.total += len(chunk)
+        if len(self.head) < self.keep:
+            take = self.keep - len(self.head)
+            self.head += chunk[:take]
+            chunk = chunk[take:]
+        if chunk:
+            self.tail.append(chunk)
+            self.tail_len += len(chunk)
+            while self.tail_len - len(self.tail[0]) >= self.keep:
+                self.tail_len -= len(self.tail.popleft())
+
+    def text(self) -> str:
+        dropped = self.total - len(self.head) - self.tail_len
+        tail = b"".join(self.tail)
+        if dropped > 0:
+            return (
+                self.head.decode("utf-8", "replace")
+                + f"\n... [{dropped} bytes omitted] ...\n"
+                + tail.decode("utf-8", "replace")
+            )
+        return (bytes(self.head) + tail).decode("utf-8", "replace")
+
+
+class _CappedResult:
+    def __init__(self, returncode: int, stdout: str, stderr: str, killed: bool):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.killed = killed
+
+
+def _run_capped(cmd_list: list, timeout: float, cwd: str) -> _CappedResult:
+    """
+    Like subprocess.run(capture_output=True) but memory is bounded: output is
+    streamed into head/tail buffers and the process is killed past MAX_OUTPUT_BYTES.
+    Raises subprocess.TimeoutExpired after `timeout` seconds.
+    """
+    proc = subprocess.Popen(
+        cmd_list, shell=False, cwd=cwd,
+        stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+    )
+    buffers = (_CappedBuffer(), _CappedBuffer())
+    killed = threading.Event()
+
+    def drain(stream, buf):
+        fd = stream.fileno()
+        while True:
+            chunk = os.read(fd, 65536)
+            if not chunk:
+                break
+            buf.feed(chunk)
+            if buffers[0].total + buffers[1].total > MAX_OUTPUT_BYTES and not killed.is_set():
+                killed.set()
+                proc.kill()
+        stream.close()
+
+    readers = [
+        threading.Thread(target=drain, args=(proc.stdout, buffers[0]), daemon=True),
+        threading.Thread(target=drain, args=(proc.stderr, buffers[1]), daemon=True),
+    ]
+    for r in readers:
+        r.start()
+    try:
+        returncode = proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+        raise
+    finally:
+        for r in readers:
+            r.join(timeout=1)
+
+    return _CappedResult(returncode, buffers[0].text(), buffers[1].text(), killed.is_set())
+
+
 # ─── Tool Schema (exported for ALL_TOOLS) ──────────────────────────────────
 
-SHELL_TOOLS = [
+SHELL_TOOLS = (
     {
         "type": "function",
         "function": {
@@ -102,5 +226,5 @@ SHELL_TOOLS = [
                 "required": ["cmd"]
             }
         }
-    }
-]
+    },
+)